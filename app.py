@@ -7,28 +7,654 @@ Designed for deployment on Render.com
 """
 
 import os
-import base64
+import binascii
+import codecs
+import hashlib
 import json
 import logging
-import tempfile
-import subprocess
+import math
 import re
 import unicodedata
+import threading
+import multiprocessing
+import queue
+from collections import OrderedDict
+from contextlib import contextmanager
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+from itertools import islice, repeat
 from io import BytesIO
-from flask import Flask, request, jsonify
+from flask import Flask, Response, request, jsonify, stream_with_context
+from flask.json.provider import DefaultJSONProvider
 from flask_cors import CORS
 import PyPDF2
-from werkzeug.exceptions import BadRequest
+from werkzeug.exceptions import BadRequest, RequestEntityTooLarge
 import magic
-from PIL import Image
+from PIL import Image, ImageSequence
+from charset_normalizer import from_bytes as charset_from_bytes
+import cache
+
+# Optional native PDF backends, resolved once at import time
+try:
+    import pypdfium2 as pdfium
+except ImportError:
+    pdfium = None
+
+try:
+    import pymupdf
+except ImportError:
+    pymupdf = None
+
+# Rust JSON encoder for responses that carry large extracted texts
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# Pure-Python PDF fallbacks and the Tesseract wrapper, imported once so
+# gunicorn's --preload shares them across workers
+try:
+    import pdfplumber
+except ImportError:
+    pdfplumber = None
+
+try:
+    from pdfminer.high_level import extract_text as pdfminer_extract_text
+except ImportError:
+    pdfminer_extract_text = None
+
+try:
+    import pytesseract
+except ImportError:
+    pytesseract = None
+
+# In-process Tesseract bindings; pytesseract (one subprocess per call) is
+# used when they are not installed
+try:
+    import tesserocr
+except ImportError:
+    tesserocr = None
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+class OrjsonProvider(DefaultJSONProvider):
+    """Flask JSON provider backed by orjson, keeping Flask's sorted keys"""
+    
+    def dumps(self, obj, **kwargs):
+        return orjson.dumps(obj, default=self.default, option=orjson.OPT_SORT_KEYS).decode()
+    
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+
 app = Flask(__name__)
+if orjson is not None:
+    app.json = OrjsonProvider(app)
 CORS(app)
 
+# Page-parallel PyPDF2 extraction settings
+PARALLEL_MIN_PAGES = 4  # Smaller documents are extracted sequentially
+MAX_PAGE_WORKERS = 8    # More workers stop paying off for PyPDF2
+
+# PyPDF2 reads this many leading pages before deciding a document has no text layer
+MIN_PROBE_PAGES = 3
+
+# pdfplumber's layout analysis is the slowest fallback; give up on it when this
+# many leading pages in a row yield no usable text (image-only document)
+MAX_LEADING_WEAK_PAGES = 5
+
+# Tesseract languages used for OCR
+OCR_LANGUAGES = 'deu+eng'
+OCR_MAX_DIMENSION = 2000  # Longest image edge handed to Tesseract, in pixels
+OCR_RENDER_DPI = 200  # Resolution PDF pages are rendered at for OCR
+# PDFs without a text layer are OCRed up to this many pages, keeping the
+# request within the gunicorn timeout
+OCR_MAX_PDF_PAGES = int(os.environ.get('OCR_MAX_PDF_PAGES', 20))
+# Same bound for the frames of multi-frame images (TIFF, GIF)
+OCR_MAX_FRAMES = int(os.environ.get('OCR_MAX_FRAMES', 20))
+# Tesseract runs outside the GIL (tesserocr) or in a subprocess (pytesseract),
+# so the pages of one document are OCRed in parallel threads. This is per
+# request, and gunicorn already runs a worker per CPU with several threads
+# each, so the default stays small.
+OCR_THREADS = int(os.environ.get('OCR_THREADS', 2))
+
+# Idle tesserocr API handles. Each handle keeps the language data loaded and
+# is not thread-safe, so a request checks one out for the duration of a call.
+# Capped like OCR_THREADS: every gunicorn worker keeps its own handles, and
+# callers beyond the cap wait for a handle instead of loading another.
+MAX_TESS_APIS = int(os.environ.get('MAX_TESS_APIS', OCR_THREADS))
+_tess_apis = queue.LifoQueue()
+_tess_api_count = 0
+_tess_api_lock = threading.Lock()
+
+# Upload limits, checked before the body is buffered or decoded
+MAX_UPLOAD_BYTES = int(os.environ.get('MAX_UPLOAD_BYTES', 50 * 1024 * 1024))
+MIME_SNIFF_BYTES = 4096  # libmagic only needs the start of a file
+PDF_HEADER_WINDOW = 1024  # '%PDF-' may appear anywhere in the first 1 KB
+SUPPORTED_MIME_PREFIXES = ('text/', 'image/', 'application/pdf')
+PDF_MAGIC = b'%PDF-'
+
+# Werkzeug enforces the same limit on bodies sent without Content-Length
+# (chunked transfer encoding) while they are read
+app.config['MAX_CONTENT_LENGTH'] = MAX_UPLOAD_BYTES
+
+# Candidate encodings for text uploads that are not valid UTF-8
+TEXT_FALLBACK_ENCODINGS = ['cp1252', 'latin_1', 'iso8859_15', 'utf_16']
+
+# Responses with at least this much text are streamed instead of buffered
+STREAM_RESPONSE_MIN_CHARS = 1024 * 1024
+
+# PDFium is not thread-safe and pypdfium2 releases the GIL in its calls, so
+# the request threads of a gthread worker take turns using it
+_pdfium_lock = threading.Lock()
+# pypdfium2 4.x reports a missing password only in the load error's message
+_PDFIUM_PASSWORD_ERROR = 'Incorrect password'
+
+# Worker process pools are created on first use and shut down after this
+# long without work, so idle gunicorn workers do not keep spawned
+# interpreters (~90 MB each) around
+POOL_IDLE_SECONDS = 5 * 60
+
+# /batch extracts whole files in a pool of worker processes once the files
+# to extract add up to BATCH_POOL_MIN_BYTES; smaller batches are cheaper to
+# extract in-process than to ship to (possibly cold) workers
+MAX_BATCH_FILES = 50
+MAX_BATCH_WORKERS = 4
+BATCH_POOL_MIN_BYTES = 2 * 1024 * 1024
+
+# Parsed PyPDF2 readers and page texts keyed by content hash, so repeated
+# extractions of the same bytes skip xref/page-tree parsing. A reader keeps
+# its whole document alive, so readers are also bounded by total PDF size
+# (per process: every gunicorn worker and page-pool worker has its own).
+READER_CACHE_SIZE = 32
+READER_CACHE_MAX_BYTES = 64 * 1024 * 1024
+PAGE_CACHE_SIZE = 4096
+_reader_cache = OrderedDict()  # digest -> (reader, lock, document size)
+_reader_cache_bytes = 0
+_page_cache = OrderedDict()
+_reader_cache_lock = threading.Lock()
+
+def _get_max_workers(num_pages):
+    """
+    Number of worker processes worth using for a document
+    
+    Args:
+        num_pages: Number of pages in the document
+        
+    Returns:
+        int: Worker count between 1 and MAX_PAGE_WORKERS
+    """
+    return min(os.cpu_count() or 1, max(1, num_pages), MAX_PAGE_WORKERS)
+
+def _get_page_block_size(num_pages, workers):
+    """
+    Number of pages per worker task
+    
+    Aims for about two blocks per worker, capped at 5 pages for short
+    documents, 10 for medium ones and 200 for long ones so blocks stay
+    small enough to balance load and bound per-task memory.
+    
+    Args:
+        num_pages: Number of pages to extract
+        workers: Number of worker processes in use
+        
+    Returns:
+        int: Block size of at least 1
+    """
+    if num_pages <= 10:
+        max_block_size = 5
+    elif num_pages <= 50:
+        max_block_size = 10
+    else:
+        max_block_size = 200
+    return max(1, min(math.ceil(num_pages / (2 * workers)), max_block_size))
+
+class _IdleProcessPool:
+    """
+    Process pool shared by the request threads of one gunicorn worker
+    
+    The executor is created on first use and shut down once it has been
+    idle for POOL_IDLE_SECONDS. It uses the spawn start method so it is
+    safe to create from threaded gunicorn workers.
+    """
+    
+    def __init__(self, max_workers, initializer=None):
+        self.max_workers = max_workers
+        self.initializer = initializer
+        self._executor = None
+        self._users = 0
+        self._idle_timer = None
+        self._lock = threading.Lock()
+    
+    @contextmanager
+    def use(self):
+        """
+        Check out the executor for the duration of a with block
+        
+        A BrokenProcessPool raised in the block discards the executor, so
+        the next request starts a fresh one.
+        
+        Yields:
+            ProcessPoolExecutor: Shared executor
+        """
+        with self._lock:
+            if self._idle_timer is not None:
+                self._idle_timer.cancel()
+                self._idle_timer = None
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.max_workers,
+                    mp_context=multiprocessing.get_context('spawn'),
+                    initializer=self.initializer
+                )
+            self._users += 1
+            executor = self._executor
+        
+        try:
+            yield executor
+        except BrokenProcessPool:
+            with self._lock:
+                if self._executor is executor:
+                    self._executor = None
+            executor.shutdown(wait=False, cancel_futures=True)
+            raise
+        finally:
+            with self._lock:
+                self._users -= 1
+                if self._users == 0 and self._executor is not None:
+                    self._idle_timer = threading.Timer(POOL_IDLE_SECONDS, self._shutdown_if_idle)
+                    self._idle_timer.daemon = True
+                    self._idle_timer.start()
+    
+    def _shutdown_if_idle(self):
+        """Shut the executor down unless it was used since this timer started"""
+        with self._lock:
+            if self._idle_timer is not threading.current_thread() or self._executor is None:
+                return
+            executor, self._executor = self._executor, None
+            self._idle_timer = None
+        logger.info("Shutting down idle worker process pool")
+        executor.shutdown(wait=False)
+
+# Page-parallel PyPDF2 extraction (batch workers never use it, see
+# _init_batch_worker)
+_page_pool = _IdleProcessPool(_get_max_workers(MAX_PAGE_WORKERS))
+
+def _get_pdf_reader(pdf_bytes, pdf_digest):
+    """
+    Return a cached PyPDF2 reader for the given bytes, parsing them on a miss
+    
+    Documents larger than READER_CACHE_MAX_BYTES are parsed but not cached.
+    
+    Args:
+        pdf_bytes: PDF file as bytes
+        pdf_digest: SHA-1 hex digest of pdf_bytes
+        
+    Returns:
+        tuple: (PyPDF2.PdfReader, threading.Lock guarding its use)
+    """
+    global _reader_cache_bytes
+    with _reader_cache_lock:
+        entry = _reader_cache.get(pdf_digest)
+        if entry is not None:
+            _reader_cache.move_to_end(pdf_digest)
+            return entry[:2]
+    
+    # Parse outside the cache lock; a concurrent miss just parses twice
+    entry = (PyPDF2.PdfReader(BytesIO(pdf_bytes)), threading.Lock(), len(pdf_bytes))
+    if len(pdf_bytes) > READER_CACHE_MAX_BYTES:
+        return entry[:2]
+    
+    with _reader_cache_lock:
+        if pdf_digest in _reader_cache:
+            entry = _reader_cache[pdf_digest]
+        else:
+            _reader_cache[pdf_digest] = entry
+            _reader_cache_bytes += len(pdf_bytes)
+        _reader_cache.move_to_end(pdf_digest)
+        while len(_reader_cache) > READER_CACHE_SIZE or _reader_cache_bytes > READER_CACHE_MAX_BYTES:
+            _reader_cache_bytes -= _reader_cache.popitem(last=False)[1][2]
+    return entry[:2]
+
+def _init_batch_worker():
+    """Keep batch workers from starting page pools of their own"""
+    global MAX_PAGE_WORKERS
+    MAX_PAGE_WORKERS = 1
+
+# Whole-file extraction for large /batch requests
+_batch_pool = _IdleProcessPool(min(os.cpu_count() or 1, MAX_BATCH_WORKERS), initializer=_init_batch_worker)
+
+def _extract_page_block(pdf_bytes, pdf_digest, page_nums):
+    """
+    Extract the text of a block of PDF pages (runs in a worker process)
+    
+    Each worker keeps its own reader cache, so a document is parsed once
+    per worker rather than once per block.
+    
+    Args:
+        pdf_bytes: PDF file as bytes
+        pdf_digest: SHA-1 hex digest of pdf_bytes
+        page_nums: Zero-based page indices to extract
+        
+    Returns:
+        list: Page texts in the order of page_nums, empty where a page has none
+    """
+    pdf_reader, reader_lock = _get_pdf_reader(pdf_bytes, pdf_digest)
+    with reader_lock:
+        return [pdf_reader.pages[page_num].extract_text() or '' for page_num in page_nums]
+
+def _extract_pages_pypdf2(pdf_reader, pdf_bytes, pdf_digest, page_nums):
+    """
+    Extract the text of the given pages, in order
+    
+    Pages found in the page cache are reused. Remaining pages of documents
+    with at least PARALLEL_MIN_PAGES pages are split into blocks that are
+    spread across the shared process pool; smaller ones (or single-CPU
+    hosts) are read with the already open reader.
+    
+    Args:
+        pdf_reader: Open PyPDF2.PdfReader for pdf_bytes
+        pdf_bytes: PDF file as bytes
+        pdf_digest: SHA-1 hex digest of pdf_bytes
+        page_nums: Zero-based page indices to extract
+        
+    Returns:
+        list: Page texts in the order of page_nums
+    """
+    page_nums = list(page_nums)
+    with _reader_cache_lock:
+        page_texts = [_page_cache.get((pdf_digest, page_num)) for page_num in page_nums]
+    missing_positions = [position for position, page_text in enumerate(page_texts) if page_text is None]
+    if not missing_positions:
+        return page_texts
+    missing_pages = [page_nums[position] for position in missing_positions]
+    
+    workers = _get_max_workers(len(missing_pages))
+    if len(missing_pages) < PARALLEL_MIN_PAGES or workers == 1:
+        extracted = [pdf_reader.pages[page_num].extract_text() or '' for page_num in missing_pages]
+    else:
+        # Hand out blocks of pages rather than single pages, to amortize
+        # task pickling and keep workers busy
+        block_size = _get_page_block_size(len(missing_pages), workers)
+        page_blocks = [missing_pages[i:i + block_size] for i in range(0, len(missing_pages), block_size)]
+        logger.info(f"Extracting {len(missing_pages)} pages with {workers} worker processes in {len(page_blocks)} blocks")
+        with _page_pool.use() as page_pool:
+            block_texts = list(page_pool.map(
+                _extract_page_block,
+                repeat(pdf_bytes, len(page_blocks)),
+                repeat(pdf_digest, len(page_blocks)),
+                page_blocks
+            ))
+        extracted = [page_text for block in block_texts for page_text in block]
+    
+    with _reader_cache_lock:
+        for position, page_text in zip(missing_positions, extracted):
+            page_key = (pdf_digest, page_nums[position])
+            page_texts[position] = page_text
+            _page_cache[page_key] = page_text
+            _page_cache.move_to_end(page_key)
+        while len(_page_cache) > PAGE_CACHE_SIZE:
+            _page_cache.popitem(last=False)
+    return page_texts
+
+def _extract_with_pdfium(pdf_bytes, max_pages=None):
+    """
+    Extract page texts and metadata with pypdfium2 (native PDFium bindings)
+    
+    Args:
+        pdf_bytes: PDF file as bytes
+        max_pages: Only read this many leading pages (None for all)
+        
+    Returns:
+        tuple: (page texts in page order, total page count, metadata dict)
+    """
+    with _pdfium_lock:
+        pdf = pdfium.PdfDocument(pdf_bytes)
+        try:
+            num_pages = len(pdf)
+            page_texts = []
+            for page_num in range(min(num_pages, max_pages or num_pages)):
+                page = pdf[page_num]
+                textpage = page.get_textpage()
+                try:
+                    # PDFium separates lines with CRLF
+                    page_texts.append(textpage.get_text_bounded().replace('\r\n', '\n'))
+                finally:
+                    textpage.close()
+                    page.close()
+            
+            return page_texts, num_pages, _get_pdfium_metadata(pdf)
+        finally:
+            pdf.close()
+
+# Document information keys of each backend, mapped to the response's keys
+_PDFIUM_METADATA_KEYS = (
+    ('Title', 'title'), ('Author', 'author'), ('Subject', 'subject'),
+    ('Creator', 'creator'), ('Producer', 'producer'),
+    ('CreationDate', 'creation_date'), ('ModDate', 'modification_date'),
+)
+_PYMUPDF_METADATA_KEYS = (
+    ('title', 'title'), ('author', 'author'), ('subject', 'subject'),
+    ('creator', 'creator'), ('producer', 'producer'),
+    ('creationDate', 'creation_date'), ('modDate', 'modification_date'),
+)
+_PYPDF2_METADATA_KEYS = (
+    ('/Title', 'title'), ('/Author', 'author'), ('/Subject', 'subject'),
+    ('/Creator', 'creator'), ('/Producer', 'producer'),
+    ('/CreationDate', 'creation_date'), ('/ModDate', 'modification_date'),
+)
+
+def _get_pdfium_metadata(pdf):
+    """
+    Read the document information dictionary of an open pypdfium2 document
+    
+    Args:
+        pdf: pypdfium2.PdfDocument
+        
+    Returns:
+        dict: Metadata in the service's response format
+    """
+    pdf_metadata = pdf.get_metadata_dict()
+    return {key: pdf_metadata.get(pdf_key, '') for pdf_key, key in _PDFIUM_METADATA_KEYS}
+
+def _get_pypdf2_metadata(pdf_reader):
+    """
+    Read the document information dictionary through a PyPDF2 reader
+    
+    Args:
+        pdf_reader: PyPDF2.PdfReader (caller holds its lock)
+        
+    Returns:
+        dict: Metadata in the service's response format, empty if the PDF has none
+    """
+    # PyPDF2 re-resolves /Info on every .metadata access, so read it once
+    pdf_info = pdf_reader.metadata
+    if not pdf_info:
+        return {}
+    # Indexing (unlike dict.get) resolves indirect objects; values are PDF
+    # string objects, so they are converted to plain strings for JSON
+    return {
+        key: str(pdf_info[pdf_key] or '') if pdf_key in pdf_info else ''
+        for pdf_key, key in _PYPDF2_METADATA_KEYS
+    }
+
+def _is_password_protected(pdf_bytes):
+    """
+    Check whether a PDF needs a password that we do not have
+    
+    Only used when pypdfium2 is not installed; otherwise Method 1 detects
+    protected documents while opening them. Documents encrypted with an
+    empty user password open normally and are not considered protected.
+    
+    Args:
+        pdf_bytes: PDF file as bytes
+        
+    Returns:
+        bool: True if no backend will be able to read the document
+    """
+    if pymupdf is not None:
+        try:
+            with pymupdf.open(stream=pdf_bytes, filetype='pdf') as doc:
+                return bool(doc.needs_pass) and not doc.authenticate('')
+        except Exception as e:
+            # Unparseable documents are left to the fallback chain to report
+            logger.info(f"Encryption check failed: {str(e)}")
+            return False
+    
+    try:
+        # Not cached: the reader is only needed for this check
+        pdf_reader = PyPDF2.PdfReader(BytesIO(pdf_bytes))
+    except Exception as e:
+        logger.info(f"Encryption check failed: {str(e)}")
+        return False
+    if not pdf_reader.is_encrypted:
+        return False
+    try:
+        return not pdf_reader.decrypt('')
+    except Exception as e:
+        # e.g. AES without PyCryptodome installed: PyPDF2 cannot read it
+        logger.info(f"PyPDF2 cannot decrypt PDF: {str(e)}")
+        return True
+
+def _password_protected_result():
+    """Extraction result for a PDF that needs a password"""
+    logger.warning("PDF is password-protected, skipping extraction")
+    return {
+        'success': False,
+        'text': '',
+        'text_length': 0,
+        'pages': 0,
+        'metadata': {'encrypted': True},
+        'method': 'encrypted',
+        'error': 'PDF is password-protected'
+    }
+
+def _extract_with_pymupdf(pdf_bytes, max_pages=None):
+    """
+    Extract page texts and metadata with PyMuPDF (native MuPDF bindings)
+    
+    Args:
+        pdf_bytes: PDF file as bytes
+        max_pages: Only read this many leading pages (None for all)
+        
+    Returns:
+        tuple: (page texts in page order, total page count, metadata dict)
+    """
+    with pymupdf.open(stream=pdf_bytes, filetype='pdf') as doc:
+        num_pages = doc.page_count
+        page_texts = [doc[page_num].get_text('text') for page_num in range(min(num_pages, max_pages or num_pages))]
+        
+        doc_metadata = doc.metadata or {}
+        metadata = {key: doc_metadata.get(doc_key, '') for doc_key, key in _PYMUPDF_METADATA_KEYS}
+        return page_texts, num_pages, metadata
+
+# File signatures recognised without a libmagic call
+_FILE_SIGNATURES = (
+    (PDF_MAGIC, 'application/pdf'),
+    (b'\x89PNG', 'image/png'),
+    (b'\xff\xd8\xff', 'image/jpeg'),
+    (b'GIF8', 'image/gif'),
+)
+
+def decode_base64(encoded):
+    """
+    Decode a base64 string
+    
+    binascii.a2b_base64 reads an ASCII str buffer directly and skips line
+    breaks and other non-alphabet characters itself, so the string is not
+    copied; the only new allocation is the decoded output. Non-ASCII input
+    raises ValueError, which callers report as invalid base64 data.
+    
+    Args:
+        encoded: Base64 string
+        
+    Returns:
+        bytes: Decoded data
+    """
+    if not encoded.isascii():
+        raise ValueError('base64 data must be ASCII')
+    return binascii.a2b_base64(encoded)
+
+def decode_base64_head(encoded, num_bytes):
+    """
+    Decode roughly the first num_bytes bytes of a base64 string
+    
+    Lets the file type be checked before the whole payload is decoded.
+    
+    Args:
+        encoded: Base64 string
+        num_bytes: Number of leading bytes needed
+        
+    Returns:
+        bytes: Leading decoded bytes, empty if they are not valid base64
+    """
+    # 4 characters per 3 bytes, with room for line breaks, cut back to
+    # whole 4-character groups once whitespace is removed
+    head = ''.join(encoded[:num_bytes * 4 // 3 + 128].split())
+    head = head[:len(head) - len(head) % 4]
+    try:
+        return decode_base64(head)[:num_bytes]
+    except ValueError:
+        return b''
+
+# python-magic's module-level from_buffer shares one Magic instance (and its
+# lock) across all threads; each request thread gets its own instead
+_mime_sniffers = threading.local()
+
+def _get_mime_sniffer():
+    """
+    Return this thread's libmagic handle, loading the database on first use
+    
+    Returns:
+        magic.Magic: MIME-type detector
+    """
+    sniffer = getattr(_mime_sniffers, 'sniffer', None)
+    if sniffer is None:
+        sniffer = _mime_sniffers.sniffer = magic.Magic(mime=True)
+    return sniffer
+
+def detect_mime_type(data):
+    """
+    Detect the MIME type of a file from its first bytes
+    
+    Common PDF and image signatures are matched directly; anything else is
+    passed to libmagic, limited to the first MIME_SNIFF_BYTES bytes.
+    
+    Args:
+        data: File content (or its leading bytes)
+        
+    Returns:
+        str: Detected MIME type
+    """
+    for signature, mime_type in _FILE_SIGNATURES:
+        if data.startswith(signature):
+            return mime_type
+    return _get_mime_sniffer().from_buffer(data[:MIME_SNIFF_BYTES])
+
+# Text cleanup patterns, compiled once at import time
+_CONTROL_CHARS_RE = re.compile(r'[\x00-\x08\x0B\x0C\x0E-\x1F\x7F-\x9F]')
+_EXCESS_NEWLINES_RE = re.compile(r'\n\s*\n\s*\n')
+_HORIZONTAL_WS_RE = re.compile(r'[ \t]+')
+_NEWLINE_PADDING_RE = re.compile(r' *\n *')
+_UNREADABLE_CHARS_RE = re.compile(r'[^a-zA-ZäöüßÄÖÜ0-9\s.,;:!?()[\]{}"\'-]')
+
+# is_text_readable judges long texts from this many characters, taken from
+# the start, middle and end
+READABILITY_SAMPLE_CHARS = 4096
+
+# UTF-8 text mis-decoded as cp1252, mapped back to the intended characters
+_MOJIBAKE_REPLACEMENTS = {
+    'Ã¤': 'ä', 'Ã¶': 'ö', 'Ã¼': 'ü', 'ÃŸ': 'ß',
+    'Ã„': 'Ä', 'Ã–': 'Ö', 'Ãœ': 'Ü',
+    'â‚¬': '€', 'â€œ': '"', 'â€': '"', 'â€™': "'",
+    'â€¦': '...', 'â€“': '–', 'â€”': '—'
+}
+# Longest sequences first so e.g. 'â€™' is not consumed by its prefix 'â€'
+_MOJIBAKE_RE = re.compile('|'.join(
+    map(re.escape, sorted(_MOJIBAKE_REPLACEMENTS, key=len, reverse=True))
+))
+
 def clean_extracted_text(text):
     """
     Clean and normalize extracted text, especially for German characters
@@ -42,27 +668,22 @@ def clean_extracted_text(text):
     if not text:
         return ""
     
+    # Fix common encoding issues with German characters (single pass). This
+    # runs first: NFKC would rewrite e.g. the '¼' in 'Ã¼' and break the match.
+    # Every sequence starts with 'Ã' or 'â', so clean text skips the regex.
+    if 'Ã' in text or 'â' in text:
+        text = _MOJIBAKE_RE.sub(lambda match: _MOJIBAKE_REPLACEMENTS[match.group(0)], text)
+    
     # Normalize Unicode characters (especially important for German umlauts)
     text = unicodedata.normalize('NFKC', text)
     
     # Remove control characters but keep newlines and tabs
-    text = re.sub(r'[\x00-\x08\x0B\x0C\x0E-\x1F\x7F-\x9F]', '', text)
-    
-    # Fix common encoding issues with German characters
-    replacements = {
-        'Ã¤': 'ä', 'Ã¶': 'ö', 'Ã¼': 'ü', 'ÃŸ': 'ß',
-        'Ã„': 'Ä', 'Ã–': 'Ö', 'Ãœ': 'Ü',
-        'â‚¬': '€', 'â€œ': '"', 'â€': '"', 'â€™': "'",
-        'â€¦': '...', 'â€"': '–', 'â€"': '—'
-    }
-    
-    for wrong, correct in replacements.items():
-        text = text.replace(wrong, correct)
+    text = _CONTROL_CHARS_RE.sub('', text)
     
     # Remove excessive whitespace while preserving paragraph structure
-    text = re.sub(r'\n\s*\n\s*\n', '\n\n', text)  # Max 2 consecutive newlines
-    text = re.sub(r'[ \t]+', ' ', text)  # Multiple spaces/tabs to single space
-    text = re.sub(r' *\n *', '\n', text)  # Remove spaces around newlines
+    text = _EXCESS_NEWLINES_RE.sub('\n\n', text)  # Max 2 consecutive newlines
+    text = _HORIZONTAL_WS_RE.sub(' ', text)  # Multiple spaces/tabs to single space
+    text = _NEWLINE_PADDING_RE.sub('\n', text)  # Remove spaces around newlines
     
     return text.strip()
 
@@ -71,78 +692,207 @@ def is_text_readable(text, min_readable_ratio=0.7):
     Check if extracted text is readable (not garbled)
     
     Args:
-        text: Text to check
+        text: Text to check, already stripped (as clean_extracted_text returns it)
         min_readable_ratio: Minimum ratio of readable characters
         
     Returns:
         bool: True if text appears readable
     """
-    if not text or len(text.strip()) < 10:
+    total_chars = len(text)
+    if total_chars < 10:
         return False
     
-    # Count readable characters (letters, numbers, common punctuation, spaces)
-    readable_chars = len(re.findall(r'[a-zA-ZäöüßÄÖÜ0-9\s.,;:!?()[\]{}"\'-]', text))
-    total_chars = len(text)
+    # Garbled extraction affects a whole document, so a sample is enough
+    if total_chars > READABILITY_SAMPLE_CHARS:
+        window = READABILITY_SAMPLE_CHARS // 3
+        middle = (total_chars - window) // 2
+        text = text[:window] + text[middle:middle + window] + text[-window:]
+        total_chars = len(text)
     
-    if total_chars == 0:
-        return False
+    # Count readable characters (letters, numbers, common punctuation, spaces);
+    # matching the rest keeps the match list short for readable text
+    readable_chars = total_chars - len(_UNREADABLE_CHARS_RE.findall(text))
     
     readable_ratio = readable_chars / total_chars
     return readable_ratio >= min_readable_ratio
 
-def extract_pdf_text_reliable(pdf_bytes):
+def extract_pdf_metadata(pdf_bytes):
+    """
+    Read page count and metadata of a PDF without extracting any text
+    
+    Only the trailer, the document information dictionary and the page
+    tree's /Count are read; no page is parsed.
+    
+    Args:
+        pdf_bytes: PDF file as bytes
+        
+    Returns:
+        dict: Extraction result with empty text, page count and metadata
+    """
+    try:
+        if pdfium is not None:
+            with _pdfium_lock:
+                pdf = pdfium.PdfDocument(pdf_bytes)
+                try:
+                    num_pages = len(pdf)
+                    metadata = _get_pdfium_metadata(pdf)
+                finally:
+                    pdf.close()
+            method = 'pypdfium2-metadata'
+        else:
+            pdf_reader, reader_lock = _get_pdf_reader(pdf_bytes, hashlib.sha1(pdf_bytes).hexdigest())
+            with reader_lock:
+                # len(pdf_reader.pages) would flatten the whole page tree
+                num_pages = int(pdf_reader.trailer['/Root']['/Pages']['/Count'])
+                metadata = _get_pypdf2_metadata(pdf_reader)
+            method = 'PyPDF2-metadata'
+        
+        return {
+            'success': True,
+            'text': '',
+            'text_length': 0,
+            'pages': num_pages,
+            'metadata': metadata,
+            'method': method,
+            'error': None
+        }
+    
+    except Exception as e:
+        logger.error(f"PDF metadata extraction failed: {str(e)}")
+        return {
+            'success': False,
+            'text': '',
+            'text_length': 0,
+            'pages': 0,
+            'metadata': {},
+            'method': 'error',
+            'error': str(e)
+        }
+
+def extract_pdf_text_reliable(pdf_bytes, max_pages=None):
     """
     Extract text from PDF bytes using multiple fallback methods
     
     Args:
         pdf_bytes: PDF file as bytes
+        max_pages: Only extract this many leading pages (None for all)
         
     Returns:
         dict: Extraction result with success status, text, and metadata
     """
     try:
-        # Method 1: PyPDF2 with enhanced German text handling
+        # Password-protected PDFs fail in every backend, so answer them
+        # without trying the fallback chain. pdfium reports them when Method 1
+        # opens the document; without it they are checked up front ('/Encrypt'
+        # in the bytes is a cheap pre-filter).
+        if pdfium is None and b'/Encrypt' in pdf_bytes and _is_password_protected(pdf_bytes):
+            return _password_protected_result()
+        
+        # Method 1: pypdfium2 (native PDFium, much faster than pure-Python parsers)
+        if pdfium is None:
+            logger.info("pypdfium2 not available")
+        else:
+            try:
+                page_texts, num_pages, metadata = _extract_with_pdfium(pdf_bytes, max_pages)
+                extracted_text = clean_extracted_text("\n".join(page_text for page_text in page_texts if page_text))
+                is_readable = is_text_readable(extracted_text)
+                text_length = len(extracted_text)  # clean_extracted_text already strips
+                
+                if text_length > 10 and is_readable:
+                    logger.info(f"pypdfium2 extracted {text_length} characters from {num_pages} pages (readable: {is_readable})")
+                    return {
+                        'success': True,
+                        'text': extracted_text,
+                        'text_length': text_length,
+                        'pages': num_pages,
+                        'metadata': metadata,
+                        'method': 'pypdfium2-enhanced',
+                        'error': None
+                    }
+                elif not extracted_text and (tesserocr is not None or pytesseract is not None):
+                    # No text layer at all (scanned document): the other text
+                    # backends would find nothing either, so OCR right away
+                    logger.info(f"pypdfium2 found no text in {num_pages} pages, running OCR")
+                    return extract_pdf_text_with_ocr(pdf_bytes, max_pages)
+                else:
+                    logger.warning(f"pypdfium2 extracted text but quality insufficient (readable: {is_readable}), trying fallback methods")
+            except pdfium.PdfiumError as e:
+                if _PDFIUM_PASSWORD_ERROR in str(e):
+                    return _password_protected_result()
+                logger.warning(f"pypdfium2 failed: {str(e)}, trying fallback methods")
+            except Exception as e:
+                logger.warning(f"pypdfium2 failed: {str(e)}, trying fallback methods")
+        
+        # Method 2: PyMuPDF (native MuPDF)
+        if pymupdf is None:
+            logger.info("PyMuPDF not available")
+        else:
+            try:
+                page_texts, num_pages, metadata = _extract_with_pymupdf(pdf_bytes, max_pages)
+                extracted_text = clean_extracted_text("\n".join(page_text for page_text in page_texts if page_text))
+                is_readable = is_text_readable(extracted_text)
+                text_length = len(extracted_text)  # clean_extracted_text already strips
+                
+                if text_length > 10 and is_readable:
+                    logger.info(f"PyMuPDF extracted {text_length} characters from {num_pages} pages (readable: {is_readable})")
+                    return {
+                        'success': True,
+                        'text': extracted_text,
+                        'text_length': text_length,
+                        'pages': num_pages,
+                        'metadata': metadata,
+                        'method': 'PyMuPDF-enhanced',
+                        'error': None
+                    }
+                elif not extracted_text and pdfium is None and (tesserocr is not None or pytesseract is not None):
+                    # Scanned document and no pdfium to have caught it in Method 1
+                    logger.info(f"PyMuPDF found no text in {num_pages} pages, running OCR")
+                    return extract_pdf_text_with_ocr(pdf_bytes, max_pages)
+                else:
+                    logger.warning(f"PyMuPDF extracted text but quality insufficient (readable: {is_readable}), trying fallback methods")
+            except Exception as e:
+                logger.warning(f"PyMuPDF failed: {str(e)}, trying fallback methods")
+        
+        # Method 3: PyPDF2 with enhanced German text handling
         try:
-            pdf_stream = BytesIO(pdf_bytes)
-            pdf_reader = PyPDF2.PdfReader(pdf_stream)
-            
-            # Get number of pages
-            num_pages = len(pdf_reader.pages)
-            logger.info(f"PDF has {num_pages} pages")
+            # Readers are cached by content hash and are not thread-safe,
+            # so hold the reader's lock while reading from it
+            pdf_digest = hashlib.sha1(pdf_bytes).hexdigest()
+            pdf_reader, reader_lock = _get_pdf_reader(pdf_bytes, pdf_digest)
+            with reader_lock:
+                # Get number of pages
+                num_pages = len(pdf_reader.pages)
+                logger.info(f"PDF has {num_pages} pages")
+                
+                # Probe the first pages before committing to the whole document,
+                # so image-only PDFs reach the fallbacks without a full parse
+                last_page = min(num_pages, max_pages or num_pages)
+                probe_pages = min(MIN_PROBE_PAGES, last_page)
+                page_texts = _extract_pages_pypdf2(pdf_reader, pdf_bytes, pdf_digest, range(probe_pages))
+                if last_page > probe_pages and len("".join(page_texts).strip()) < 10:
+                    logger.info(f"PyPDF2 found no text on the first {probe_pages} pages, skipping the rest")
+                else:
+                    # Extract text from the remaining pages (in parallel for larger documents)
+                    page_texts += _extract_pages_pypdf2(pdf_reader, pdf_bytes, pdf_digest, range(probe_pages, last_page))
+                
+                # Get metadata
+                metadata = _get_pypdf2_metadata(pdf_reader)
             
-            # Extract text from all pages
-            extracted_text = ""
-            for page_num in range(num_pages):
-                page = pdf_reader.pages[page_num]
-                page_text = page.extract_text()
-                if page_text:
-                    extracted_text += page_text + "\n"
+            extracted_text = "\n".join(page_text for page_text in page_texts if page_text)
             
             # Clean and normalize the text for German characters
             extracted_text = clean_extracted_text(extracted_text)
             
             # Check if text is readable
             is_readable = is_text_readable(extracted_text)
+            text_length = len(extracted_text)  # clean_extracted_text already strips
             
-            # Get metadata
-            metadata = {}
-            if pdf_reader.metadata:
-                metadata = {
-                    'title': pdf_reader.metadata.get('/Title', ''),
-                    'author': pdf_reader.metadata.get('/Author', ''),
-                    'subject': pdf_reader.metadata.get('/Subject', ''),
-                    'creator': pdf_reader.metadata.get('/Creator', ''),
-                    'producer': pdf_reader.metadata.get('/Producer', ''),
-                    'creation_date': str(pdf_reader.metadata.get('/CreationDate', '')),
-                    'modification_date': str(pdf_reader.metadata.get('/ModDate', ''))
-                }
-            
-            if extracted_text and len(extracted_text.strip()) > 10 and is_readable:
-                logger.info(f"PyPDF2 extracted {len(extracted_text)} characters from {num_pages} pages (readable: {is_readable})")
+            if text_length > 10 and is_readable:
+                logger.info(f"PyPDF2 extracted {text_length} characters from {num_pages} pages (readable: {is_readable})")
                 return {
                     'success': True,
                     'text': extracted_text,
-                    'text_length': len(extracted_text),
+                    'text_length': text_length,
                     'pages': num_pages,
                     'metadata': metadata,
                     'method': 'PyPDF2-enhanced',
@@ -154,60 +904,73 @@ def extract_pdf_text_reliable(pdf_bytes):
         except Exception as e:
             logger.warning(f"PyPDF2 failed: {str(e)}, trying fallback methods")
         
-        # Method 2: pdfplumber fallback with text cleaning
-        try:
-            import pdfplumber
-            with pdfplumber.open(BytesIO(pdf_bytes)) as pdf:
-                extracted_text = ""
-                for page in pdf.pages:
-                    page_text = page.extract_text()
-                    if page_text:
-                        extracted_text += page_text + "\n"
+        # The pure-Python fallbacks share one stream, rewound before each use
+        pdf_stream = BytesIO(pdf_bytes)
+        
+        # Method 4: pdfplumber fallback with text cleaning
+        if pdfplumber is None:
+            logger.info("pdfplumber not available")
+        else:
+            try:
+                pdf_stream.seek(0)
+                with pdfplumber.open(pdf_stream) as pdf:
+                    page_texts = []
+                    for page_num, page in enumerate(pdf.pages[:max_pages]):
+                        page_text = page.extract_text()
+                        if page_text:
+                            page_texts.append(page_text)
+                        
+                        # Stop early on documents whose first pages are all empty
+                        if page_num + 1 == MAX_LEADING_WEAK_PAGES and len("".join(page_texts).strip()) < 10:
+                            logger.info(f"pdfplumber found no text on the first {MAX_LEADING_WEAK_PAGES} pages, skipping the rest")
+                            break
+                    extracted_text = "\n".join(page_texts)
+                    
+                    # Clean and normalize the text
+                    extracted_text = clean_extracted_text(extracted_text)
+                    is_readable = is_text_readable(extracted_text)
+                    text_length = len(extracted_text)  # clean_extracted_text already strips
+                    
+                    if text_length > 10 and is_readable:
+                        logger.info(f"pdfplumber extracted {text_length} characters (readable: {is_readable})")
+                        return {
+                            'success': True,
+                            'text': extracted_text,
+                            'text_length': text_length,
+                            'pages': len(pdf.pages),
+                            'metadata': {},
+                            'method': 'pdfplumber-enhanced',
+                            'error': None
+                        }
+            except Exception as e:
+                logger.warning(f"pdfplumber failed: {str(e)}")
+        
+        # Method 5: pdfminer fallback with text cleaning
+        if pdfminer_extract_text is None:
+            logger.info("pdfminer not available")
+        else:
+            try:
+                pdf_stream.seek(0)
+                extracted_text = pdfminer_extract_text(pdf_stream, maxpages=max_pages or 0)
                 
                 # Clean and normalize the text
                 extracted_text = clean_extracted_text(extracted_text)
                 is_readable = is_text_readable(extracted_text)
+                text_length = len(extracted_text)  # clean_extracted_text already strips
                 
-                if extracted_text and len(extracted_text.strip()) > 10 and is_readable:
-                    logger.info(f"pdfplumber extracted {len(extracted_text)} characters (readable: {is_readable})")
+                if text_length > 10 and is_readable:
+                    logger.info(f"pdfminer extracted {text_length} characters (readable: {is_readable})")
                     return {
                         'success': True,
                         'text': extracted_text,
-                        'text_length': len(extracted_text),
-                        'pages': len(pdf.pages),
+                        'text_length': text_length,
+                        'pages': 1,  # pdfminer doesn't easily give page count
                         'metadata': {},
-                        'method': 'pdfplumber-enhanced',
+                        'method': 'pdfminer-enhanced',
                         'error': None
                     }
-        except ImportError:
-            logger.info("pdfplumber not available")
-        except Exception as e:
-            logger.warning(f"pdfplumber failed: {str(e)}")
-        
-        # Method 3: pdfminer fallback with text cleaning
-        try:
-            from pdfminer.high_level import extract_text
-            extracted_text = extract_text(BytesIO(pdf_bytes))
-            
-            # Clean and normalize the text
-            extracted_text = clean_extracted_text(extracted_text)
-            is_readable = is_text_readable(extracted_text)
-            
-            if extracted_text and len(extracted_text.strip()) > 10 and is_readable:
-                logger.info(f"pdfminer extracted {len(extracted_text)} characters (readable: {is_readable})")
-                return {
-                    'success': True,
-                    'text': extracted_text,
-                    'text_length': len(extracted_text),
-                    'pages': 1,  # pdfminer doesn't easily give page count
-                    'metadata': {},
-                    'method': 'pdfminer-enhanced',
-                    'error': None
-                }
-        except ImportError:
-            logger.info("pdfminer not available")
-        except Exception as e:
-            logger.warning(f"pdfminer failed: {str(e)}")
+            except Exception as e:
+                logger.warning(f"pdfminer failed: {str(e)}")
         
         # If all methods fail
         return {
@@ -232,6 +995,207 @@ def extract_pdf_text_reliable(pdf_bytes):
             'error': str(e)
         }
 
+def _prepare_image_for_ocr(image):
+    """
+    Reduce an image to what Tesseract needs: grayscale, bounded size
+    
+    Tesseract's runtime grows with the pixel count, so large photos are
+    scaled down to at most OCR_MAX_DIMENSION pixels on the long edge.
+    
+    Args:
+        image: PIL image (or image frame)
+        
+    Returns:
+        PIL.Image.Image: Grayscale copy of the image
+    """
+    image = image.convert('L')
+    image.thumbnail((OCR_MAX_DIMENSION, OCR_MAX_DIMENSION), Image.LANCZOS)
+    return image
+
+def _acquire_tess_api():
+    """
+    Check out an idle tesserocr API handle, creating one if under the limit
+    
+    Blocks until a handle is returned when MAX_TESS_APIS are in use.
+    
+    Returns:
+        tesserocr.PyTessBaseAPI: Initialized API handle
+    """
+    global _tess_api_count
+    try:
+        return _tess_apis.get_nowait()
+    except queue.Empty:
+        pass
+    
+    with _tess_api_lock:
+        create = _tess_api_count < MAX_TESS_APIS
+        if create:
+            _tess_api_count += 1
+    
+    if not create:
+        return _tess_apis.get()
+    
+    try:
+        return tesserocr.PyTessBaseAPI(lang=OCR_LANGUAGES)
+    except Exception:
+        with _tess_api_lock:
+            _tess_api_count -= 1
+        raise
+
+def _ocr_image(image):
+    """
+    Run Tesseract on a prepared image
+    
+    Uses a pooled tesserocr handle when available, otherwise pytesseract.
+    
+    Args:
+        image: PIL image
+        
+    Returns:
+        str: Recognized text
+    """
+    if tesserocr is None:
+        return pytesseract.image_to_string(image, lang=OCR_LANGUAGES)
+    
+    api = _acquire_tess_api()
+    try:
+        api.SetImage(image)
+        return api.GetUTF8Text()
+    finally:
+        _tess_apis.put(api)
+
+def _ocr_images(images):
+    """
+    OCR prepared images in parallel threads
+    
+    Images are pulled from the iterable in the calling thread, so the first
+    pages are already being recognized while later ones are rendered.
+    
+    Args:
+        images: Iterable of prepared PIL images
+        
+    Returns:
+        list: Recognized text per image, in input order
+    """
+    with ThreadPoolExecutor(max_workers=OCR_THREADS) as executor:
+        return list(executor.map(_ocr_image, images))
+
+def _ocr_pdf_pages_pdfium(pdf_bytes, max_pages):
+    """
+    Render leading PDF pages with PDFium and OCR them
+    
+    Args:
+        pdf_bytes: PDF file as bytes
+        max_pages: Number of leading pages to OCR
+        
+    Returns:
+        tuple: (OCR text per page, total page count)
+    """
+    with _pdfium_lock:
+        pdf = pdfium.PdfDocument(pdf_bytes)
+        num_pages = len(pdf)
+    try:
+        # PDFium is not thread-safe, so pages are rendered in this thread and
+        # the lock is only held per page, not while Tesseract runs
+        def render_pages():
+            for page_num in range(min(num_pages, max_pages)):
+                with _pdfium_lock:
+                    page = pdf[page_num]
+                    try:
+                        image = page.render(scale=OCR_RENDER_DPI / 72, grayscale=True).to_pil()
+                    finally:
+                        page.close()
+                yield _prepare_image_for_ocr(image)
+        
+        return _ocr_images(render_pages()), num_pages
+    finally:
+        with _pdfium_lock:
+            pdf.close()
+
+def _ocr_pdf_pages_pymupdf(pdf_bytes, max_pages):
+    """
+    Render leading PDF pages with PyMuPDF and OCR them
+    
+    Args:
+        pdf_bytes: PDF file as bytes
+        max_pages: Number of leading pages to OCR
+        
+    Returns:
+        tuple: (OCR text per page, total page count)
+    """
+    with pymupdf.open(stream=pdf_bytes, filetype='pdf') as doc:
+        num_pages = doc.page_count
+        
+        def render_pages():
+            for page_num in range(min(num_pages, max_pages)):
+                pixmap = doc[page_num].get_pixmap(dpi=OCR_RENDER_DPI, colorspace=pymupdf.csGRAY)
+                image = Image.frombytes('L', (pixmap.width, pixmap.height), pixmap.samples)
+                yield _prepare_image_for_ocr(image)
+        
+        return _ocr_images(render_pages()), num_pages
+
+def extract_pdf_text_with_ocr(pdf_bytes, max_pages=None):
+    """
+    Extract text from a PDF without a text layer by rendering and OCRing its pages
+    
+    Pages are rendered with pypdfium2, or with PyMuPDF when pdfium is not
+    installed.
+    
+    Args:
+        pdf_bytes: PDF file as bytes
+        max_pages: Only OCR this many leading pages (None for all, up to OCR_MAX_PDF_PAGES)
+        
+    Returns:
+        dict: Extraction result with success status and text
+    """
+    try:
+        page_limit = min(max_pages or OCR_MAX_PDF_PAGES, OCR_MAX_PDF_PAGES)
+        if pdfium is not None:
+            page_texts, num_pages = _ocr_pdf_pages_pdfium(pdf_bytes, page_limit)
+            method = 'OCR-pdfium'
+        else:
+            page_texts, num_pages = _ocr_pdf_pages_pymupdf(pdf_bytes, page_limit)
+            method = 'OCR-PyMuPDF'
+        ocr_pages = len(page_texts)
+        
+        extracted_text = clean_extracted_text("\n".join(page_texts))
+        is_readable = is_text_readable(extracted_text)
+        text_length = len(extracted_text)  # clean_extracted_text already strips
+        
+        if text_length > 10 and is_readable:
+            logger.info(f"OCR extracted {text_length} characters from {ocr_pages} of {num_pages} PDF pages")
+            return {
+                'success': True,
+                'text': extracted_text,
+                'text_length': text_length,
+                'pages': num_pages,
+                'metadata': {'ocr': True, 'ocr_pages': ocr_pages},
+                'method': method,
+                'error': None
+            }
+        else:
+            return {
+                'success': False,
+                'text': '',
+                'text_length': 0,
+                'pages': num_pages,
+                'metadata': {'ocr': True, 'ocr_pages': ocr_pages},
+                'method': 'OCR-failed',
+                'error': 'PDF has no text layer and OCR extracted insufficient text'
+            }
+    
+    except Exception as e:
+        logger.error(f"PDF OCR failed: {str(e)}")
+        return {
+            'success': False,
+            'text': '',
+            'text_length': 0,
+            'pages': 0,
+            'metadata': {'ocr': False},
+            'method': 'OCR-error',
+            'error': str(e)
+        }
+
 def extract_text_from_image(image_bytes, filename):
     """
     Extract text from image using OCR (Tesseract)
@@ -244,40 +1208,7 @@ def extract_text_from_image(image_bytes, filename):
         dict: Extraction result with success status and text
     """
     try:
-        # Try to use pytesseract for OCR
-        try:
-            import pytesseract
-            from PIL import Image
-            
-            # Open image from bytes
-            image = Image.open(BytesIO(image_bytes))
-            
-            # Perform OCR with German and English language support
-            extracted_text = pytesseract.image_to_string(image, lang='deu+eng')
-            
-            if extracted_text and len(extracted_text.strip()) > 5:
-                logger.info(f"OCR extracted {len(extracted_text)} characters from image")
-                return {
-                    'success': True,
-                    'text': f"Image Document: {filename}\n\nOCR Extracted Content:\n{extracted_text.strip()}",
-                    'text_length': len(extracted_text.strip()),
-                    'pages': 1,
-                    'metadata': {'ocr': True, 'image_format': image.format},
-                    'method': 'OCR-pytesseract',
-                    'error': None
-                }
-            else:
-                return {
-                    'success': False,
-                    'text': f"Image Document: {filename}\n\nOCR failed to extract readable text",
-                    'text_length': 0,
-                    'pages': 1,
-                    'metadata': {'ocr': True},
-                    'method': 'OCR-failed',
-                    'error': 'OCR extracted insufficient text'
-                }
-                
-        except ImportError:
+        if tesserocr is None and pytesseract is None:
             logger.warning("pytesseract not available for OCR")
             return {
                 'success': False,
@@ -288,7 +1219,45 @@ def extract_text_from_image(image_bytes, filename):
                 'method': 'OCR-unavailable',
                 'error': 'OCR library not available'
             }
-            
+        
+        # Open image from bytes
+        image = Image.open(BytesIO(image_bytes))
+        image_format = image.format
+        
+        num_frames = getattr(image, 'n_frames', 1)
+        
+        # Perform OCR with German and English language support, frame by
+        # frame for multi-page images such as scanned TIFFs
+        frame_texts = _ocr_images(
+            _prepare_image_for_ocr(frame)
+            for frame in islice(ImageSequence.Iterator(image), OCR_MAX_FRAMES)
+        )
+        ocr_pages = len(frame_texts)
+        extracted_text = "\n\n".join(frame_texts).strip()
+        text_length = len(extracted_text)
+        
+        if text_length > 5:
+            logger.info(f"OCR extracted {text_length} characters from {ocr_pages} of {num_frames} image frames")
+            return {
+                'success': True,
+                'text': f"Image Document: {filename}\n\nOCR Extracted Content:\n{extracted_text}",
+                'text_length': text_length,
+                'pages': num_frames,
+                'metadata': {'ocr': True, 'ocr_pages': ocr_pages, 'image_format': image_format},
+                'method': 'OCR-pytesseract' if tesserocr is None else 'OCR-tesserocr',
+                'error': None
+            }
+        else:
+            return {
+                'success': False,
+                'text': f"Image Document: {filename}\n\nOCR failed to extract readable text",
+                'text_length': 0,
+                'pages': num_frames,
+                'metadata': {'ocr': True, 'ocr_pages': ocr_pages},
+                'method': 'OCR-failed',
+                'error': 'OCR extracted insufficient text'
+            }
+        
     except Exception as e:
         logger.error(f"Image OCR failed: {str(e)}")
         return {
@@ -301,7 +1270,7 @@ def extract_text_from_image(image_bytes, filename):
             'error': str(e)
         }
 
-def extract_text_from_file(file_bytes, filename, mime_type):
+def extract_text_from_file(file_bytes, filename, mime_type, max_pages=None):
     """
     Extract text from various file types
     
@@ -309,6 +1278,7 @@ def extract_text_from_file(file_bytes, filename, mime_type):
         file_bytes: File content as bytes
         filename: Original filename
         mime_type: MIME type of the file
+        max_pages: Only extract this many leading PDF pages (None for all)
         
     Returns:
         dict: Extraction result with success status and text
@@ -316,24 +1286,23 @@ def extract_text_from_file(file_bytes, filename, mime_type):
     try:
         # Handle text files with enhanced encoding detection
         if mime_type.startswith('text/'):
-            text_content = None
-            encoding_used = 'unknown'
-            
-            # Try multiple encodings in order of preference for German text
-            encodings_to_try = ['utf-8', 'utf-8-sig', 'latin-1', 'cp1252', 'iso-8859-1']
-            
-            for encoding in encodings_to_try:
-                try:
-                    text_content = file_bytes.decode(encoding)
-                    encoding_used = encoding
-                    break
-                except UnicodeDecodeError:
-                    continue
-            
-            # If all encodings fail, use utf-8 with error handling
-            if text_content is None:
-                text_content = file_bytes.decode('utf-8', errors='replace')
-                encoding_used = 'utf-8-replace'
+            # UTF-8 (with or without BOM) is by far the most common case and a
+            # single C-level decode; only other files go through detection
+            encoding_used = 'utf-8-sig' if file_bytes.startswith(codecs.BOM_UTF8) else 'utf-8'
+            try:
+                text_content = file_bytes.decode(encoding_used)
+            except UnicodeDecodeError:
+                # Let charset-normalizer pick between the legacy encodings
+                # German text actually arrives in; unrestricted, it reads
+                # short Latin-1 lines as Chinese codepages
+                best_match = charset_from_bytes(file_bytes, cp_isolation=TEXT_FALLBACK_ENCODINGS).best()
+                if best_match is not None:
+                    text_content = str(best_match)
+                    encoding_used = best_match.encoding
+                else:
+                    # latin-1 maps every byte, so this cannot fail
+                    text_content = file_bytes.decode('latin-1')
+                    encoding_used = 'latin-1'
             
             # Clean the text content
             text_content = clean_extracted_text(text_content)
@@ -350,7 +1319,7 @@ def extract_text_from_file(file_bytes, filename, mime_type):
         
         # Handle PDF files
         elif mime_type == 'application/pdf':
-            return extract_pdf_text_reliable(file_bytes)
+            return extract_pdf_text_reliable(file_bytes, max_pages)
         
         # Handle image files
         elif mime_type.startswith('image/'):
@@ -380,6 +1349,31 @@ def extract_text_from_file(file_bytes, filename, mime_type):
             'error': str(e)
         }
 
+def get_cache_key(file_bytes, filename, mime_type, max_pages=None):
+    """
+    Build the result cache key for an upload
+    
+    Text and image results embed the filename, so it is part of their key;
+    PDF results do not, so the same document is found under any name. Image
+    and PDF keys include the OCR languages (scanned PDFs are OCRed), so
+    changing them invalidates entries.
+    
+    Args:
+        file_bytes: File content as bytes
+        filename: Original filename
+        mime_type: MIME type of the file
+        max_pages: PDF page cap requested (None for all)
+        
+    Returns:
+        str: Cache key
+    """
+    content_hash = hashlib.sha256(file_bytes).hexdigest()
+    if mime_type.startswith('image/'):
+        return f"ocr:{content_hash}:{OCR_LANGUAGES}:{filename}"
+    if mime_type == 'application/pdf':
+        return f"extract:{content_hash}:{mime_type}:{OCR_LANGUAGES}:{max_pages or 'all'}"
+    return f"extract:{content_hash}:{mime_type}:{filename}:{max_pages or 'all'}"
+
 @app.route('/', methods=['GET'])
 def health_check():
     """Health check endpoint"""
@@ -413,6 +1407,10 @@ def extract_document():
         filename = 'unknown'
         mime_type = None
         
+        # Reject oversized uploads before reading the body
+        if request.content_length is not None and request.content_length > MAX_UPLOAD_BYTES:
+            raise RequestEntityTooLarge()
+        
         # Handle multipart form data
         if 'file' in request.files:
             file = request.files['file']
@@ -420,32 +1418,54 @@ def extract_document():
                 raise BadRequest('No file selected')
             
             filename = file.filename
-            file_bytes = file.read()
             
-            # Detect MIME type
+            # Detect MIME type from the first bytes only
+            head = file.stream.read(MIME_SNIFF_BYTES)
+            file.stream.seek(0)
+            
+            # A declared PDF must carry its header within the first 1 KB
+            if file.mimetype == 'application/pdf' and PDF_MAGIC not in head[:PDF_HEADER_WINDOW]:
+                raise BadRequest('File is not a PDF document')
+            
             try:
-                mime_type = magic.from_buffer(file_bytes, mime=True)
+                mime_type = detect_mime_type(head)
             except:
                 # Fallback to content type from request
                 mime_type = file.content_type or 'application/octet-stream'
             
+            # Unsupported types are answered from the sniffed head alone
+            if mime_type.startswith(SUPPORTED_MIME_PREFIXES):
+                file_bytes = file.read()
+            else:
+                file_bytes = head
+            
             logger.info(f"Received file upload: {filename} ({len(file_bytes)} bytes, {mime_type})")
         
         # Handle JSON with base64 data
         elif request.is_json:
-            data = request.get_json()
+            # Don't let Flask keep the raw body / parsed JSON around: the
+            # base64 payload is the largest object in the request
+            data = request.get_json(cache=False)
             if 'data' not in data:
                 raise BadRequest('Missing base64 data field')
+            if not isinstance(data['data'], str):
+                raise BadRequest('Invalid base64 data: data field must be a string')
+            
+            # A declared PDF must carry its header within the first 1 KB, as
+            # for multipart uploads; check before decoding the whole payload
+            if data.get('mime_type') == 'application/pdf' and PDF_MAGIC not in decode_base64_head(data['data'], PDF_HEADER_WINDOW):
+                raise BadRequest('Data is not a PDF document')
             
             try:
-                file_bytes = base64.b64decode(data['data'])
+                # Hand over the only reference so the string can be freed early
+                file_bytes = decode_base64(data.pop('data'))
                 filename = data.get('filename', 'unknown')
                 mime_type = data.get('mime_type')
                 
                 # Detect MIME type if not provided
                 if not mime_type:
                     try:
-                        mime_type = magic.from_buffer(file_bytes, mime=True)
+                        mime_type = detect_mime_type(file_bytes)
                     except:
                         mime_type = 'application/octet-stream'
                 
@@ -460,8 +1480,28 @@ def extract_document():
         if not file_bytes or len(file_bytes) < 10:
             raise BadRequest('Invalid or empty file data')
         
-        # Extract text using appropriate method
-        result = extract_text_from_file(file_bytes, filename, mime_type)
+        # Optional cap on the number of PDF pages to extract
+        max_pages = request.args.get('max_pages', type=int)
+        if max_pages is not None and max_pages < 1:
+            raise BadRequest('max_pages must be a positive integer')
+        
+        metadata_only = request.args.get('metadata_only', '').lower() in ('1', 'true', 'yes')
+        if metadata_only and mime_type == 'application/pdf':
+            # Page count and metadata only: cheap enough to skip the result cache
+            result = extract_pdf_metadata(file_bytes)
+        else:
+            # Serve repeated uploads of the same document from the result cache
+            cache_key = get_cache_key(file_bytes, filename, mime_type, max_pages)
+            force_refresh = request.args.get('forceRefresh', '').lower() in ('1', 'true', 'yes')
+            result = None if force_refresh else cache.get(cache_key)
+            
+            if result is not None:
+                logger.info(f"Serving cached extraction for {filename}")
+            else:
+                # Extract text using appropriate method
+                result = extract_text_from_file(file_bytes, filename, mime_type, max_pages)
+                if result['success']:
+                    cache.set(cache_key, result)
         
         # Add filename and mime_type to result
         result['filename'] = filename
@@ -469,8 +1509,27 @@ def extract_document():
         
         logger.info(f"Extraction completed: {result['success']}, {result['text_length']} characters, method: {result.get('method', 'unknown')}")
         
+        # Without orjson, stream large results so the pure-Python encoder's
+        # output is never held in memory twice
+        if orjson is None and result['text_length'] >= STREAM_RESPONSE_MIN_CHARS:
+            return Response(
+                stream_with_context(json.JSONEncoder(sort_keys=True, separators=(',', ':')).iterencode(result)),
+                mimetype='application/json'
+            )
         return jsonify(result)
         
+    except RequestEntityTooLarge:
+        logger.error(f"Upload too large: over {MAX_UPLOAD_BYTES} bytes")
+        return jsonify({
+            'success': False,
+            'text': '',
+            'text_length': 0,
+            'pages': 0,
+            'metadata': {},
+            'method': 'error',
+            'error': f'File too large: limit is {MAX_UPLOAD_BYTES} bytes'
+        }), 413
+        
     except BadRequest as e:
         logger.error(f"Bad request: {str(e)}")
         return jsonify({
@@ -495,6 +1554,126 @@ def extract_document():
             'error': f'Internal server error: {str(e)}'
         }), 500
 
+@app.route('/batch', methods=['POST'])
+def extract_batch():
+    """
+    Extract text from several uploaded documents in one request
+    
+    Accepts:
+    - Multipart form data with one or more 'files' fields
+    
+    Files are extracted in parallel worker processes; cached and duplicate
+    documents are only extracted once.
+    
+    Returns:
+    - JSON with a 'results' list in upload order
+    """
+    try:
+        # Reject oversized uploads before reading the body
+        if request.content_length is not None and request.content_length > MAX_UPLOAD_BYTES:
+            raise RequestEntityTooLarge()
+        
+        files = request.files.getlist('files')
+        if not files:
+            raise BadRequest('No files provided. Send multipart form data with one or more "files" fields')
+        if len(files) > MAX_BATCH_FILES:
+            raise BadRequest(f'Too many files: limit is {MAX_BATCH_FILES} per batch')
+        
+        max_pages = request.args.get('max_pages', type=int)
+        if max_pages is not None and max_pages < 1:
+            raise BadRequest('max_pages must be a positive integer')
+        force_refresh = request.args.get('forceRefresh', '').lower() in ('1', 'true', 'yes')
+        
+        results = [None] * len(files)
+        pending = {}  # cache key -> (file_bytes, filename, mime_type, [(result index, filename)])
+        
+        for index, file in enumerate(files):
+            filename = file.filename or 'unknown'
+            file_bytes = file.read()
+            if len(file_bytes) < 10:
+                results[index] = {
+                    'success': False,
+                    'text': '',
+                    'text_length': 0,
+                    'pages': 0,
+                    'metadata': {},
+                    'method': 'error',
+                    'error': 'Invalid or empty file data',
+                    'filename': filename,
+                    'mime_type': None
+                }
+                continue
+            
+            try:
+                mime_type = detect_mime_type(file_bytes[:MIME_SNIFF_BYTES])
+            except:
+                mime_type = file.content_type or 'application/octet-stream'
+            
+            cache_key = get_cache_key(file_bytes, filename, mime_type, max_pages)
+            if cache_key in pending:
+                pending[cache_key][3].append((index, filename))
+                continue
+            
+            result = None if force_refresh else cache.get(cache_key)
+            if result is not None:
+                result.update(filename=filename, mime_type=mime_type)
+                results[index] = result
+            else:
+                pending[cache_key] = (file_bytes, filename, mime_type, [(index, filename)])
+        
+        logger.info(f"Batch of {len(files)} files, {len(pending)} to extract")
+        
+        extracted = {}
+        pending_bytes = sum(len(file_bytes) for file_bytes, _, _, _ in pending.values())
+        if len(pending) > 1 and pending_bytes >= BATCH_POOL_MIN_BYTES and _batch_pool.max_workers > 1:
+            try:
+                with _batch_pool.use() as batch_pool:
+                    futures = {
+                        batch_pool.submit(extract_text_from_file, file_bytes, filename, mime_type, max_pages): cache_key
+                        for cache_key, (file_bytes, filename, mime_type, _) in pending.items()
+                    }
+                    for future in as_completed(futures):
+                        extracted[futures[future]] = future.result()
+            except BrokenProcessPool:
+                logger.warning("Batch worker pool broke, extracting the rest sequentially")
+        
+        for cache_key, (file_bytes, filename, mime_type, uploads) in pending.items():
+            result = extracted.get(cache_key)
+            if result is None:
+                result = extract_text_from_file(file_bytes, filename, mime_type, max_pages)
+            if result['success']:
+                cache.set(cache_key, result)
+            # Duplicate PDFs may have been uploaded under different names
+            for index, upload_filename in uploads:
+                results[index] = dict(result, filename=upload_filename, mime_type=mime_type)
+        
+        logger.info(f"Batch completed: {sum(result['success'] for result in results)}/{len(results)} successful")
+        return jsonify({'results': results})
+        
+    except RequestEntityTooLarge:
+        logger.error(f"Batch upload too large: over {MAX_UPLOAD_BYTES} bytes")
+        return jsonify({
+            'success': False,
+            'results': [],
+            'error': f'Upload too large: limit is {MAX_UPLOAD_BYTES} bytes'
+        }), 413
+        
+    except BadRequest as e:
+        logger.error(f"Bad batch request: {str(e)}")
+        return jsonify({
+            'success': False,
+            'results': [],
+            'error': str(e)
+        }), 400
+        
+    except Exception as e:
+        logger.error(f"Unexpected batch error: {str(e)}")
+        return jsonify({
+            'success': False,
+            'results': [],
+            'error': f'Internal server error: {str(e)}'
+        }), 500
+
 @app.route('/test', methods=['GET'])
 def test_endpoint():
     """Test endpoint with sample PDF processing"""
@@ -514,9 +1693,38 @@ def test_endpoint():
         }
     })
 
+def warm_up_backends():
+    """
+    Run a blank one-page PDF through every PDF extraction backend
+    
+    Loads the parsers' lazily initialized state (native libraries, font and
+    codec tables) before the first real request pays for it.
+    """
+    writer = PyPDF2.PdfWriter()
+    writer.add_blank_page(width=612, height=792)
+    buffer = BytesIO()
+    writer.write(buffer)
+    
+    pdf_bytes = buffer.getvalue()
+    
+    # Call each backend directly: the cascade would send a blank page to OCR
+    if pdfium is not None:
+        _extract_with_pdfium(pdf_bytes)
+    if pymupdf is not None:
+        _extract_with_pymupdf(pdf_bytes)
+    PyPDF2.PdfReader(BytesIO(pdf_bytes)).pages[0].extract_text()
+    if pdfplumber is not None:
+        with pdfplumber.open(BytesIO(pdf_bytes)) as pdf:
+            pdf.pages[0].extract_text()
+    if pdfminer_extract_text is not None:
+        pdfminer_extract_text(BytesIO(pdf_bytes))
+    logger.info("PDF extraction backends warmed up")
+
 if __name__ == '__main__':
+    # Development server only; production runs under gunicorn (see Dockerfile)
     port = int(os.environ.get('PORT', 5000))
     debug = os.environ.get('FLASK_ENV') == 'development'
     
+    warm_up_backends()
     logger.info(f"Starting PDF Extraction Service on port {port}")
     app.run(host='0.0.0.0', port=port, debug=debug)
\ No newline at end of file
@@ -0,0 +1,245 @@
+#!/usr/bin/env python3
+"""
+Extraction Result Cache
+Content-addressed cache for extraction results
+In-process LRU by default, shared between the workers of one instance
+through CACHE_DIR and across instances through Redis when REDIS_URL is set
+"""
+
+import os
+import json
+import hashlib
+import logging
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+# Entries hold whole extracted texts; orjson encodes them several times faster
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# In-process cache size and default time-to-live (7 days). Entries hold
+# whole extracted texts, so the cache is also bounded by their total size
+# (estimated from the text length; every gunicorn worker has its own).
+LOCAL_CACHE_SIZE = 256
+LOCAL_CACHE_MAX_BYTES = 64 * 1024 * 1024
+DEFAULT_TTL = 7 * 24 * 60 * 60
+
+# key -> (expiry timestamp, value, size), evicted least-recently-used
+_local_cache = OrderedDict()
+_local_cache_bytes = 0
+_local_cache_lock = threading.Lock()
+
+# Optional on-disk backend shared by all workers on the same machine
+CACHE_DIR = os.environ.get('CACHE_DIR')
+if CACHE_DIR:
+    os.makedirs(CACHE_DIR, exist_ok=True)
+
+# CACHE_DIR is swept at most this often: expired entries are deleted, then
+# the soonest-expiring ones while the directory is over CACHE_DIR_MAX_BYTES
+DISK_SWEEP_INTERVAL = 10 * 60
+CACHE_DIR_MAX_BYTES = int(os.environ.get('CACHE_DIR_MAX_BYTES', 1024 * 1024 * 1024))
+_next_disk_sweep = 0
+_disk_sweep_lock = threading.Lock()
+
+# Optional shared backend
+_redis = None
+if os.environ.get('REDIS_URL'):
+    try:
+        import redis
+        _redis = redis.Redis.from_url(os.environ['REDIS_URL'])
+        logger.info("Using Redis for the extraction result cache")
+    except ImportError:
+        logger.warning("REDIS_URL is set but the redis package is not installed, using in-process cache only")
+
+def _set_local(key, value, expires_at):
+    """
+    Store a value in the in-process LRU, evicting the oldest entries
+    
+    Values larger than LOCAL_CACHE_MAX_BYTES are left to the shared backends.
+    """
+    global _local_cache_bytes
+    size = len(value.get('text') or '')
+    if size > LOCAL_CACHE_MAX_BYTES:
+        return
+    with _local_cache_lock:
+        previous = _local_cache.pop(key, None)
+        if previous is not None:
+            _local_cache_bytes -= previous[2]
+        _local_cache[key] = (expires_at, value, size)
+        _local_cache_bytes += size
+        while len(_local_cache) > LOCAL_CACHE_SIZE or _local_cache_bytes > LOCAL_CACHE_MAX_BYTES:
+            _local_cache_bytes -= _local_cache.popitem(last=False)[1][2]
+
+def _dumps(value):
+    """Serialize a cache entry to JSON bytes"""
+    if orjson is not None:
+        return orjson.dumps(value)
+    return json.dumps(value).encode('utf-8')
+
+def _loads(payload):
+    """Parse a cache entry from JSON bytes"""
+    if orjson is not None:
+        return orjson.loads(payload)
+    return json.loads(payload)
+
+def _disk_path(key):
+    """Path of the on-disk entry for a key (keys may contain any character)"""
+    return os.path.join(CACHE_DIR, hashlib.sha256(key.encode('utf-8')).hexdigest() + '.json')
+
+def _get_disk(key):
+    """
+    Read an entry from CACHE_DIR, deleting it if it has expired
+    
+    Returns:
+        tuple: (expiry timestamp, value), or None on a miss
+    """
+    path = _disk_path(key)
+    try:
+        with open(path, 'rb') as f:
+            entry = _loads(f.read())
+        expires_at = float(entry['expires_at'])
+        value = entry['value']
+        if not isinstance(value, dict):
+            raise ValueError(f"unexpected entry value of type {type(value).__name__}")
+    except FileNotFoundError:
+        return None
+    except Exception as e:
+        logger.warning(f"Disk cache lookup failed: {str(e)}")
+        return None
+    
+    if expires_at <= time.time():
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+        return None
+    return expires_at, value
+
+def _set_disk(key, value, expires_at):
+    """Write an entry to CACHE_DIR atomically, so readers never see half a file"""
+    try:
+        fd, tmp_path = tempfile.mkstemp(dir=CACHE_DIR, suffix='.tmp')
+        with os.fdopen(fd, 'wb') as f:
+            f.write(_dumps({'expires_at': expires_at, 'value': value}))
+        # The modification time records the expiry, so sweeps only stat files
+        os.utime(tmp_path, (expires_at, expires_at))
+        os.replace(tmp_path, _disk_path(key))
+    except Exception as e:
+        logger.warning(f"Disk cache store failed: {str(e)}")
+
+def _sweep_disk():
+    """
+    Delete expired entries from CACHE_DIR, then the soonest-expiring ones
+    until the directory is within CACHE_DIR_MAX_BYTES
+    """
+    now = time.time()
+    entries = []
+    total_bytes = 0
+    for dir_entry in os.scandir(CACHE_DIR):
+        try:
+            stat = dir_entry.stat()
+            if dir_entry.name.endswith('.tmp'):
+                # Left behind by a worker that died while writing
+                if stat.st_mtime < now - DISK_SWEEP_INTERVAL:
+                    os.remove(dir_entry.path)
+            elif dir_entry.name.endswith('.json'):
+                if stat.st_mtime <= now:
+                    os.remove(dir_entry.path)
+                else:
+                    entries.append((stat.st_mtime, stat.st_size, dir_entry.path))
+                    total_bytes += stat.st_size
+        except OSError:
+            pass  # Removed by another worker in the meantime
+    
+    entries.sort()
+    for _, size, path in entries:
+        if total_bytes <= CACHE_DIR_MAX_BYTES:
+            break
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+        total_bytes -= size
+
+def _maybe_sweep_disk():
+    """Sweep CACHE_DIR if DISK_SWEEP_INTERVAL has passed since the last sweep"""
+    global _next_disk_sweep
+    now = time.time()
+    with _disk_sweep_lock:
+        if now < _next_disk_sweep:
+            return
+        _next_disk_sweep = now + DISK_SWEEP_INTERVAL
+    
+    try:
+        _sweep_disk()
+    except Exception as e:
+        logger.warning(f"Disk cache sweep failed: {str(e)}")
+
+def get(key):
+    """
+    Look up a cached result
+    
+    Args:
+        key: Cache key
+        
+    Returns:
+        dict: Shallow copy of the cached result, or None on a miss
+    """
+    global _local_cache_bytes
+    with _local_cache_lock:
+        entry = _local_cache.get(key)
+        if entry is not None:
+            expires_at, value, size = entry
+            if expires_at > time.time():
+                _local_cache.move_to_end(key)
+                return dict(value)
+            del _local_cache[key]
+            _local_cache_bytes -= size
+    
+    if CACHE_DIR:
+        entry = _get_disk(key)
+        if entry is not None:
+            expires_at, value = entry
+            _set_local(key, value, expires_at)
+            return dict(value)
+    
+    if _redis is not None:
+        try:
+            payload = _redis.get(key)
+            if payload is not None:
+                value = _loads(payload)
+                ttl = _redis.ttl(key)
+                _set_local(key, value, time.time() + (ttl if ttl > 0 else DEFAULT_TTL))
+                return dict(value)
+        except Exception as e:
+            logger.warning(f"Redis cache lookup failed: {str(e)}")
+    
+    return None
+
+def set(key, value, ttl=DEFAULT_TTL):
+    """
+    Store a result
+    
+    Args:
+        key: Cache key
+        value: JSON-serializable result dict
+        ttl: Time-to-live in seconds
+    """
+    expires_at = time.time() + ttl
+    _set_local(key, dict(value), expires_at)
+    
+    if CACHE_DIR:
+        _set_disk(key, value, expires_at)
+        _maybe_sweep_disk()
+    
+    if _redis is not None:
+        try:
+            _redis.set(key, _dumps(value), ex=ttl)
+        except Exception as e:
+            logger.warning(f"Redis cache store failed: {str(e)}")
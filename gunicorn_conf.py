@@ -0,0 +1,30 @@
+#!/usr/bin/env python3
+"""
+Gunicorn Configuration
+Production server settings for the PDF Extraction Service
+Used by the Dockerfile and render.yaml: gunicorn -c gunicorn_conf.py app:app
+"""
+
+import os
+import multiprocessing
+
+# Render provides PORT; the Docker image listens on 5000
+bind = f"0.0.0.0:{os.environ.get('PORT', '5000')}"
+
+# Extraction is CPU-bound, so one worker per CPU (override with WEB_CONCURRENCY);
+# the second thread per worker keeps slow uploads from idling a worker
+workers = int(os.environ.get('WEB_CONCURRENCY', multiprocessing.cpu_count()))
+worker_class = 'gthread'
+threads = int(os.environ.get('GUNICORN_THREADS', 2))
+
+# Import app.py (and the PDF/OCR libraries it loads) once in the master so
+# workers share the loaded modules copy-on-write
+preload_app = True
+
+# Large scanned PDFs can take a while to OCR
+timeout = 120
+
+def when_ready(server):
+    """Warm the PDF backends in the master, before any worker is forked"""
+    from app import warm_up_backends
+    warm_up_backends()